@@ -5,34 +5,50 @@ Converts EPUB/PDF books to high-quality MP3 audiobooks using AI
 
 import streamlit as st
 import asyncio
+import hashlib
+import importlib.util
 import os
 import logging
+import pickle
+import re
+import shutil
 from pathlib import Path
 import tempfile
+import time
 import zipfile
 from datetime import datetime
+import numpy as np
 
-# Core modules
-from core.text_extractor import TextExtractor
-from core.text_processor import TextProcessor
-from core.tts_converter import TTSConverter
-from core.audio_merger import AudioMerger
+# Core modules are imported where they are used, so the page loads
+# without pulling in TTS engines, torch or pydub
 from config import settings
 
+# Path separators and control characters, stripped from output filenames
+_FN_SAFE = re.compile(r'[\x00-\x1f\x7f/\\]+')
+
+# Minimum seconds between progress bar redraws during conversion
+PROGRESS_UPDATE_INTERVAL = 0.1
+
 # Configure logging
 logging.basicConfig(level=getattr(logging, settings.log_level))
 logger = logging.getLogger(__name__)
 
-def main():
-    st.set_page_config(
-        page_title="🎧 Enhanced Audiobook Converter",
-        page_icon="🎧",
-        layout="wide",
-        initial_sidebar_state="expanded"
-    )
+@st.cache_resource
+def _coqui_available():
+    """Check once per process whether Coqui TTS is installed, without importing it."""
+    return importlib.util.find_spec("TTS") is not None
+
+@st.cache_resource
+def _get_tts(engine, voice):
+    """Build a TTSConverter once per (engine, voice) and reuse it across reruns."""
+    from core.tts_converter import TTSConverter
     
-    # Custom CSS for better UI
-    st.markdown("""
+    return TTSConverter(engine=engine, voice=voice)
+
+@st.cache_data
+def _get_css():
+    """Custom CSS for better UI, built once per process."""
+    return """
     <style>
     .main-header {
         font-size: 2.5rem;
@@ -61,132 +77,46 @@ def main():
         margin: 1rem 0;
     }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+@st.cache_data
+def _get_header_html():
+    """Page CSS plus the header banner."""
+    return (
+        _get_css()
+        + '<h1 class="main-header">🎧 Enhanced Audiobook Converter</h1>'
+        + '<div class="feature-box">✨ Now with <strong>Coqui TTS</strong> for studio-quality voice synthesis! ✨</div>'
+    )
+
+@st.cache_data
+def _get_features_markdown():
+    """Feature list for the side column, as one markdown block."""
+    features = [
+        "🎙️ **Coqui TTS**: Studio-quality voice synthesis",
+        "⚡ **Smart Caching**: 3x faster processing",
+        "🤖 **AI Enhancement**: Gemini-powered text optimization", 
+        "🎭 **Multiple Voices**: Choose your perfect narrator",
+        "📱 **Easy Interface**: Drag, drop, and convert",
+        "🔧 **Customizable**: Adjust speed, pauses, and quality",
+        "💾 **Chapter Support**: Organized audio files",
+        "🌟 **English Optimized**: Best quality for English books"
+    ]
+    return "\n\n".join(features)
+
+def main():
+    st.set_page_config(
+        page_title="🎧 Enhanced Audiobook Converter",
+        page_icon="🎧",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
     
-    # Header
-    st.markdown('<h1 class="main-header">🎧 Enhanced Audiobook Converter</h1>', unsafe_allow_html=True)
-    st.markdown('<div class="feature-box">✨ Now with <strong>Coqui TTS</strong> for studio-quality voice synthesis! ✨</div>', unsafe_allow_html=True)
+    # Custom CSS and header, sent as a single element
+    st.markdown(_get_header_html(), unsafe_allow_html=True)
     
     # Sidebar for settings
     with st.sidebar:
-        st.header("⚙️ Settings")
-        
-        # TTS Engine Selection
-        st.subheader("🎙️ Voice Engine")
-        
-        # Check if Coqui TTS is available
-        try:
-            from TTS.api import TTS
-            coqui_available = True
-        except ImportError:
-            coqui_available = False
-        
-        if coqui_available:
-            st.success("✅ Coqui TTS Available (Highest Quality)")
-            engine_options = ["coqui-xtts", "edge-tts", "gtts", "pyttsx3"]
-            default_engine = "coqui-xtts"
-        else:
-            st.warning("⚠️ Coqui TTS not installed. Using fallback engines.")
-            engine_options = ["edge-tts", "gtts", "pyttsx3"]
-            default_engine = "edge-tts"
-        
-        selected_engine = st.selectbox(
-            "Select TTS Engine:",
-            engine_options,
-            index=engine_options.index(default_engine),
-            help="Coqui TTS provides the most natural voice quality"
-        )
-        
-        # Voice Selection based on engine
-        st.subheader("🗣️ Voice Selection")
-        
-        if selected_engine == "coqui-xtts":
-            voice_options = {
-                "tts_models/en/ljspeech/tacotron2-DDC": "📚 LJSpeech - Perfect for Audiobooks",
-                "tts_models/en/vctk/vits": "🎭 VCTK - Multi-Speaker Natural",
-                "tts_models/en/ljspeech/glow-tts": "⚡ GlowTTS - Fast & Clear"
-            }
-            default_voice = "tts_models/en/ljspeech/tacotron2-DDC"
-        else:
-            voice_options = {
-                "en-US-AriaNeural": "🇺🇸 Aria - Most Natural",
-                "en-US-JennyNeural": "🇺🇸 Jenny - Professional",
-                "en-US-GuyNeural": "🇺🇸 Guy - Deep Voice",
-                "en-GB-SoniaNeural": "🇬🇧 Sonia - British Accent",
-                "en-AU-NatashaNeural": "🇦🇺 Natasha - Australian"
-            }
-            default_voice = "en-US-AriaNeural"
-        
-        selected_voice = st.selectbox(
-            "Select Voice:",
-            list(voice_options.keys()),
-            format_func=lambda x: voice_options[x],
-            index=0
-        )
-        
-        # Quality indicators
-        if selected_engine == "coqui-xtts":
-            st.markdown('<span class="quality-badge">🏆 STUDIO QUALITY</span>', unsafe_allow_html=True)
-            st.info("💡 Coqui TTS provides the most human-like voice synthesis")
-        elif selected_engine == "edge-tts":
-            st.markdown('<span class="quality-badge">✨ HIGH QUALITY</span>', unsafe_allow_html=True)
-        
-        # Performance Settings
-        st.subheader("🚀 Performance")
-        
-        enable_caching = st.checkbox(
-            "Enable Smart Caching",
-            value=True,
-            help="Cache audio segments to speed up processing"
-        )
-        
-        if enable_caching:
-            st.success("✅ Caching enabled - Faster processing!")
-        
-        # Voice sample
-        if st.button("🎵 Test Voice Sample"):
-            with st.spinner("Generating voice sample..."):
-                try:
-                    tts = TTSConverter(engine=selected_engine, voice=selected_voice)
-                    tts.cache_enabled = enable_caching
-                    sample_text = "Hello! This is how your audiobook will sound. The voice quality is crisp and natural."
-                    
-                    # Generate sample in temp file
-                    temp_sample = os.path.join(settings.temp_dir, "voice_sample.mp3")
-                    success = asyncio.run(tts.convert_text_to_audio(sample_text, temp_sample))
-                    
-                    if success and os.path.exists(temp_sample):
-                        with open(temp_sample, 'rb') as audio_file:
-                            st.audio(audio_file.read(), format='audio/mp3')
-                        st.success("🎉 Voice sample generated!")
-                    else:
-                        st.error("Failed to generate voice sample")
-                except Exception as e:
-                    st.error(f"Error: {e}")
-        
-        # Cache information
-        st.subheader("📊 Cache Status")
-        try:
-            tts = TTSConverter(engine=selected_engine, voice=selected_voice)
-            cache_info = tts.get_cache_info()
-            
-            if cache_info.get("cache_enabled"):
-                st.markdown(f"""
-                <div class="cache-info">
-                <strong>Cache Status:</strong> Active<br>
-                <strong>Cached Items:</strong> {cache_info.get('cache_size', 0)}<br>
-                <strong>Storage:</strong> {cache_info.get('cache_directory', 'N/A')}
-                </div>
-                """, unsafe_allow_html=True)
-                
-                if st.button("🗑️ Clear Cache"):
-                    tts.clear_cache()
-                    st.success("Cache cleared!")
-                    st.experimental_rerun()
-            else:
-                st.info("Cache disabled")
-        except:
-            pass
+        selected_engine, selected_voice, enable_caching, tts_concurrency = render_sidebar()
     
     # Main content area
     col1, col2 = st.columns([2, 1])
@@ -249,25 +179,23 @@ def main():
                     max_chapters,
                     speech_rate,
                     add_pauses,
-                    enable_caching
+                    enable_caching,
+                    tts_concurrency
+                )
+            elif 'last_audiobook' in st.session_state:
+                # Re-offer the last audiobook on reruns without touching the disk
+                last_audiobook = st.session_state['last_audiobook']
+                st.download_button(
+                    label="📥 Download Audiobook",
+                    data=last_audiobook['data'],
+                    file_name=last_audiobook['file_name'],
+                    mime="audio/mpeg"
                 )
     
     with col2:
         st.header("🎯 Features")
         
-        features = [
-            "🎙️ **Coqui TTS**: Studio-quality voice synthesis",
-            "⚡ **Smart Caching**: 3x faster processing",
-            "🤖 **AI Enhancement**: Gemini-powered text optimization", 
-            "🎭 **Multiple Voices**: Choose your perfect narrator",
-            "📱 **Easy Interface**: Drag, drop, and convert",
-            "🔧 **Customizable**: Adjust speed, pauses, and quality",
-            "💾 **Chapter Support**: Organized audio files",
-            "🌟 **English Optimized**: Best quality for English books"
-        ]
-        
-        for feature in features:
-            st.markdown(feature)
+        st.markdown(_get_features_markdown())
         
         st.header("📈 Quality Comparison")
         
@@ -282,8 +210,163 @@ def main():
         
         st.info("💡 **Tip**: Use Coqui TTS for the most natural audiobook experience!")
 
-def convert_book(uploaded_file, engine, voice, use_ai, max_chapters, speech_rate, add_pauses, enable_cache):
+@st.fragment
+def render_sidebar():
+    """Render the settings sidebar; its widgets rerun only this fragment."""
+    st.header("⚙️ Settings")
+    
+    # TTS Engine Selection
+    st.subheader("🎙️ Voice Engine")
+    
+    # Check if Coqui TTS is available
+    coqui_available = _coqui_available()
+    
+    if coqui_available:
+        st.success("✅ Coqui TTS Available (Highest Quality)")
+        engine_options = ["coqui-xtts", "edge-tts", "gtts", "pyttsx3"]
+        default_engine = "coqui-xtts"
+    else:
+        st.warning("⚠️ Coqui TTS not installed. Using fallback engines.")
+        engine_options = ["edge-tts", "gtts", "pyttsx3"]
+        default_engine = "edge-tts"
+    
+    selected_engine = st.selectbox(
+        "Select TTS Engine:",
+        engine_options,
+        index=engine_options.index(default_engine),
+        help="Coqui TTS provides the most natural voice quality"
+    )
+    
+    # Voice Selection based on engine
+    st.subheader("🗣️ Voice Selection")
+    
+    if selected_engine == "coqui-xtts":
+        voice_options = {
+            "tts_models/en/ljspeech/tacotron2-DDC": "📚 LJSpeech - Perfect for Audiobooks",
+            "tts_models/en/vctk/vits": "🎭 VCTK - Multi-Speaker Natural",
+            "tts_models/en/ljspeech/glow-tts": "⚡ GlowTTS - Fast & Clear"
+        }
+        default_voice = "tts_models/en/ljspeech/tacotron2-DDC"
+    else:
+        voice_options = {
+            "en-US-AriaNeural": "🇺🇸 Aria - Most Natural",
+            "en-US-JennyNeural": "🇺🇸 Jenny - Professional",
+            "en-US-GuyNeural": "🇺🇸 Guy - Deep Voice",
+            "en-GB-SoniaNeural": "🇬🇧 Sonia - British Accent",
+            "en-AU-NatashaNeural": "🇦🇺 Natasha - Australian"
+        }
+        default_voice = "en-US-AriaNeural"
+    
+    selected_voice = st.selectbox(
+        "Select Voice:",
+        list(voice_options.keys()),
+        format_func=lambda x: voice_options[x],
+        index=0
+    )
+    
+    # Quality indicators
+    if selected_engine == "coqui-xtts":
+        st.markdown('<span class="quality-badge">🏆 STUDIO QUALITY</span>', unsafe_allow_html=True)
+        st.info("💡 Coqui TTS provides the most human-like voice synthesis")
+    elif selected_engine == "edge-tts":
+        st.markdown('<span class="quality-badge">✨ HIGH QUALITY</span>', unsafe_allow_html=True)
+    
+    # Performance Settings
+    st.subheader("🚀 Performance")
+    
+    enable_caching = st.checkbox(
+        "Enable Smart Caching",
+        value=True,
+        help="Cache audio segments to speed up processing"
+    )
+    
+    if enable_caching:
+        st.success("✅ Caching enabled - Faster processing!")
+    
+    tts_concurrency = st.slider(
+        "TTS Concurrency",
+        min_value=1,
+        max_value=8,
+        value=settings.max_concurrent_requests,
+        help="Parallel requests for online engines (Edge TTS, Google TTS)"
+    )
+    
+    # Voice sample
+    render_voice_sample(selected_engine, selected_voice, enable_caching)
+    
+    # Cache information
+    render_cache_status(selected_engine, selected_voice, enable_caching)
+    
+    return selected_engine, selected_voice, enable_caching, tts_concurrency
+
+@st.fragment
+def render_voice_sample(engine, voice, enable_caching):
+    """Render the voice sample button without rerunning the rest of the app."""
+    if st.button("🎵 Test Voice Sample"):
+        with st.spinner("Generating voice sample..."):
+            try:
+                tts = _get_tts(engine, voice)
+                sample_text = "Hello! This is how your audiobook will sound. The voice quality is crisp and natural."
+                
+                # Generate sample in temp file
+                temp_sample = os.path.join(settings.temp_dir, "voice_sample.mp3")
+                success = asyncio.run(tts.convert_text_to_audio(sample_text, temp_sample, enable_caching))
+                
+                if success and os.path.exists(temp_sample):
+                    with open(temp_sample, 'rb') as audio_file:
+                        st.audio(audio_file.read(), format='audio/mp3')
+                    st.success("🎉 Voice sample generated!")
+                else:
+                    st.error("Failed to generate voice sample")
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+@st.fragment
+def render_cache_status(engine, voice, enable_caching):
+    """Render cache statistics and the clear cache button."""
+    st.subheader("📊 Cache Status")
+    try:
+        tts = _get_tts(engine, voice)
+        cache_info = tts.get_cache_info()
+        
+        if enable_caching and cache_info.get("cache_enabled"):
+            st.markdown(f"""
+            <div class="cache-info">
+            <strong>Cache Status:</strong> Active<br>
+            <strong>Cached Items:</strong> {cache_info.get('cache_size', 0)}<br>
+            <strong>Storage:</strong> {cache_info.get('cache_directory', 'N/A')}
+            </div>
+            """, unsafe_allow_html=True)
+            
+            if st.button("🗑️ Clear Cache"):
+                tts.clear_cache()
+                st.success("Cache cleared!")
+                st.rerun(scope="fragment")
+        else:
+            st.info("Cache disabled")
+    except:
+        pass
+
+def convert_book(uploaded_file, engine, voice, use_ai, max_chapters, speech_rate, add_pauses, enable_cache, tts_concurrency=None):
     """Convert uploaded book to audiobook."""
+    asyncio.run(_convert_book_async(
+        uploaded_file,
+        engine,
+        voice,
+        use_ai,
+        max_chapters,
+        speech_rate,
+        add_pauses,
+        enable_cache,
+        tts_concurrency
+    ))
+
+async def _convert_book_async(uploaded_file, engine, voice, use_ai, max_chapters, speech_rate, add_pauses, enable_cache, tts_concurrency=None):
+    """Run every conversion stage on a single event loop."""
+    from core.text_extractor import TextExtractor
+    from core.text_processor import TextProcessor
+    from core.audio_merger import AudioMerger
+    
     
     progress_bar = st.progress(0)
     status_text = st.empty()
@@ -291,24 +374,37 @@ def convert_book(uploaded_file, engine, voice, use_ai, max_chapters, speech_rate
     try:
         # Save uploaded file
         with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
+            uploaded_file.seek(0)
+            shutil.copyfileobj(uploaded_file, tmp_file, length=1024 * 1024)
             temp_path = tmp_file.name
         
+        # Key the extraction and AI caches by book content
+        book_key = hashlib.blake2b(uploaded_file.getbuffer(), digest_size=16).hexdigest()
+        book_cache_dir = Path(settings.temp_dir) / 'book_cache'
+        book_cache_dir.mkdir(parents=True, exist_ok=True)
+        
         # Initialize components
         status_text.text("🔧 Initializing components...")
         progress_bar.progress(10)
         
         text_extractor = TextExtractor()
+        # Built per conversion: Gemini's async client binds to the event loop it
+        # is created on, and each conversion runs on a fresh loop
         text_processor = TextProcessor() if use_ai else None
-        tts_converter = TTSConverter(engine=engine, voice=voice)
-        tts_converter.cache_enabled = enable_cache
+        tts_converter = _get_tts(engine, voice)
         audio_merger = AudioMerger()
         
         # Extract text
         status_text.text("📖 Extracting text from book...")
         progress_bar.progress(20)
            
-        extracted_text = asyncio.run(text_extractor.extract_text(temp_path))
+        extract_cache_path = book_cache_dir / f"{book_key}.extract.v{TextExtractor.EXTRACTOR_VERSION}.pkl"
+        extracted_text = _load_cached(extract_cache_path)
+        if extracted_text is None:
+            extracted_text = await text_extractor.extract_text(temp_path)
+            _store_cached(extract_cache_path, extracted_text)
+        else:
+            st.toast("📦 Loaded extracted text from cache")
         
         if not extracted_text.get('chapters'):
             st.error("No text could be extracted from the file")
@@ -316,44 +412,94 @@ def convert_book(uploaded_file, engine, voice, use_ai, max_chapters, speech_rate
         
         chapters = extracted_text['chapters'][:max_chapters]
         st.success(f"✅ Extracted {len(chapters)} chapters")
+        processed_stream = None
         
         # Process with AI if enabled
         if use_ai and text_processor:
             status_text.text("🤖 AI processing chapters...")
             progress_bar.progress(40)
             
-            processed_chapters = asyncio.run(text_processor.process_chapters(chapters))
-            chapters = processed_chapters
-            st.success("✅ AI processing complete")
-        
-        # Convert to audio
-        status_text.text(f"🎙️ Converting to audio using {engine}...")
+            # Everything that changes the processed text is part of the key
+            process_settings = hashlib.blake2b(
+                f"{settings.gemini_model}\0{settings.gemini_temperature}\0"
+                f"{settings.max_chunk_size}\0{settings.chunk_overlap_ratio}".encode('utf-8'),
+                digest_size=8
+            ).hexdigest()
+            process_cache_path = book_cache_dir / (
+                f"{book_key}.processed.v{TextProcessor.PROMPT_VERSION}.{len(chapters)}.{process_settings}.pkl"
+            )
+            processed_chapters = _load_cached(process_cache_path)
+            if processed_chapters is None:
+                # Start TTS on each chapter as soon as Gemini finishes it
+                processed_stream = _cache_when_complete(
+                    text_processor.iter_processed_chapters(chapters),
+                    process_cache_path
+                )
+            else:
+                saved_cost = sum(text_processor.estimate_processing_cost(ch['text']) for ch in chapters)
+                st.toast(f"📦 Loaded AI-processed text from cache (saved ~${saved_cost:.4f})")
+                chapters = processed_chapters
+                st.success("✅ AI processing complete")
+        
+        # Convert to audio and merge chapters as they land
+        if processed_stream:
+            status_text.text(f"🤖🎙️ AI processing and converting to audio using {engine}...")
+        else:
+            status_text.text(f"🎙️ Converting to audio using {engine}...")
         progress_bar.progress(60)
         
         audio_dir = os.path.join(settings.temp_dir, f"audio_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
         os.makedirs(audio_dir, exist_ok=True)
         
-        audio_files = asyncio.run(tts_converter.convert_chapters_to_audio(chapters, audio_dir))
-        
-        if not audio_files:
-            st.error("Failed to convert any chapters to audio")
-            return
+        safe_title = _FN_SAFE.sub('', uploaded_file.name.rsplit('.', 1)[0].replace(' ', '_')) or 'book'
+        output_filename = f"{safe_title}_audiobook.mp3"
+        output_path = os.path.join(settings.output_dir, output_filename)
         
-        st.success(f"✅ Converted {len(audio_files)} chapters to audio")
+        st.session_state['chapters_converted'] = 0
+        last_ui_update = [0.0]
         
-        # Merge audio files
-        status_text.text("🔗 Merging audio files...")
-        progress_bar.progress(80)
+        def on_chapter_merged(audio_path):
+            st.session_state['chapters_converted'] += 1
+            converted = st.session_state['chapters_converted']
+            
+            # Limit progress redraws to PROGRESS_UPDATE_INTERVAL, always showing the last chapter
+            now = time.monotonic()
+            if now - last_ui_update[0] < PROGRESS_UPDATE_INTERVAL and converted < len(chapters):
+                return
+            last_ui_update[0] = now
+            
+            status_text.text(f"🔗 Merged chapter {converted}/{len(chapters)}...")
+            progress_bar.progress(60 + int(35 * converted / len(chapters)))
+        
+        success = await _pipeline(
+            tts_converter,
+            audio_merger,
+            processed_stream or chapters,
+            audio_dir,
+            output_path,
+            extracted_text.get('metadata', {}),
+            on_chapter_merged,
+            enable_cache,
+            tts_concurrency
+        )
         
-        output_filename = f"{uploaded_file.name.rsplit('.', 1)[0]}_audiobook.mp3"
-        output_path = os.path.join(settings.output_dir, output_filename)
+        if not st.session_state['chapters_converted']:
+            st.error("Failed to convert any chapters to audio")
+            return
         
-        success = await_merge_audio(audio_files, output_path, extracted_text.get('metadata', {}))
+        st.success(f"✅ Converted {st.session_state['chapters_converted']} chapters to audio")
         
         if success:
             progress_bar.progress(100)
             status_text.text("✅ Audiobook created successfully!")
             
+            # Read the audiobook once for size, download and preview
+            audio_bytes = Path(output_path).read_bytes()
+            st.session_state['last_audiobook'] = {
+                'file_name': output_filename,
+                'data': audio_bytes
+            }
+            
             # Display results
             st.success("🎉 **Audiobook conversion complete!**")
             
@@ -361,28 +507,30 @@ def convert_book(uploaded_file, engine, voice, use_ai, max_chapters, speech_rate
             with col1:
                 st.metric("📚 Chapters", len(chapters))
             with col2:
-                file_size = os.path.getsize(output_path) / (1024 * 1024)  # MB
+                file_size = len(audio_bytes) / (1024 * 1024)  # MB
                 st.metric("💾 File Size", f"{file_size:.1f} MB")
             with col3:
-                # Estimate duration
-                total_text = " ".join([ch.get('text', '') for ch in chapters])
-                duration = tts_converter.estimate_audio_duration(total_text)
+                # Estimate duration from per-chapter word counts
+                word_counts = np.fromiter(
+                    (ch.get('text', '').count(' ') + 1 for ch in chapters),
+                    dtype=np.int32,
+                    count=len(chapters)
+                )
+                duration = tts_converter.estimate_audio_duration_from_word_count(int(word_counts.sum()))
                 st.metric("⏱️ Duration", f"{duration/60:.1f} min")
             
             # Download button
-            with open(output_path, 'rb') as audio_file:
-                st.download_button(
-                    label="📥 Download Audiobook",
-                    data=audio_file.read(),
-                    file_name=output_filename,
-                    mime="audio/mpeg",
-                    type="primary"
-                )
+            st.download_button(
+                label="📥 Download Audiobook",
+                data=audio_bytes,
+                file_name=output_filename,
+                mime="audio/mpeg",
+                type="primary"
+            )
             
             # Play preview
             st.subheader("🎵 Preview")
-            with open(output_path, 'rb') as audio_file:
-                st.audio(audio_file.read(), format='audio/mp3')
+            st.audio(audio_bytes, format='audio/mp3')
             
             # Cache info
             if enable_cache:
@@ -403,14 +551,83 @@ def convert_book(uploaded_file, engine, voice, use_ai, max_chapters, speech_rate
         except:
             pass
 
-def await_merge_audio(audio_files, output_path, metadata):
-    """Wrapper to run async audio merger."""
+def _load_cached(cache_path):
+    """Load a pickled pipeline result, or return None if it is missing or unreadable."""
     try:
-        audio_merger = AudioMerger()
-        return asyncio.run(audio_merger.merge_audio_files(audio_files, output_path, metadata))
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Failed to load cached result {cache_path}: {e}")
+        return None
+
+def _store_cached(cache_path, value):
+    """Atomically pickle a pipeline result to disk for reuse on later conversions."""
+    temp_path = cache_path.with_suffix('.tmp')
+    try:
+        with open(temp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
     except Exception as e:
-        logger.error(f"Audio merge error: {e}")
-        return False
+        logger.warning(f"Failed to cache result {cache_path}: {e}")
+
+async def _cache_when_complete(processed_chapters, cache_path):
+    """
+    Pass AI-processed chapters through, caching the full set once every chapter is done.
+    
+    Nothing is cached if any chunk fell back to basic cleanup, so a later
+    run retries Gemini instead of reusing non-AI text.
+    """
+    collected = []
+    async for i, chapter in processed_chapters:
+        collected.append(chapter)
+        yield i, chapter
+    
+    if any(chapter.get('ai_fallback') for chapter in collected):
+        logger.info("Some chunks fell back to basic cleanup, not caching processed chapters")
+        return
+    _store_cached(cache_path, collected)
+
+async def _fill_queue(chapter_audio, queue):
+    """Feed chapter audio paths into the merge queue, then signal completion."""
+    try:
+        async for _, audio_path in chapter_audio:
+            await queue.put(audio_path)
+    finally:
+        await queue.put(None)
+
+async def _pipeline(tts_converter, audio_merger, chapters, audio_dir, output_path, metadata, on_chapter,
+                    cache_enabled=True, concurrency=None):
+    """
+    Synthesize chapters and merge them concurrently, so merging overlaps TTS.
+    
+    chapters is either a list, or an async iterator of (index, chapter) from
+    AI processing, in which case TTS also overlaps the Gemini stage.
+    """
+    if isinstance(chapters, list):
+        chapter_audio = tts_converter.iter_chapter_audio(chapters, audio_dir, cache_enabled, concurrency)
+    else:
+        chapter_audio = tts_converter.iter_chapter_audio_stream(chapters, audio_dir, cache_enabled, concurrency)
+    
+    queue = asyncio.Queue(maxsize=2)
+    producer_task = asyncio.create_task(_fill_queue(chapter_audio, queue))
+    
+    try:
+        return await audio_merger.merge_from_queue(
+            queue,
+            output_path,
+            metadata,
+            on_file=on_chapter,
+            manifest_path=os.path.join(audio_dir, 'concat.txt')
+        )
+    finally:
+        if not producer_task.done():
+            producer_task.cancel()
+        try:
+            await producer_task
+        except asyncio.CancelledError:
+            pass
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,3 +1,4 @@
+import importlib.util
 import os
 from typing import Optional
 from pydantic_settings import BaseSettings
@@ -25,13 +26,16 @@ class Settings(BaseSettings):
     
     # Processing Configuration
     max_chunk_size: int = int(os.getenv("MAX_CHUNK_SIZE", "30000"))
+    chunk_overlap_ratio: float = float(os.getenv("CHUNK_OVERLAP_RATIO", "0.25"))  # Preceding text sent as Gemini context
     temp_dir: str = os.getenv("TEMP_DIR", "temp")
     output_dir: str = os.getenv("OUTPUT_DIR", "output")
     max_concurrent_requests: int = int(os.getenv("MAX_CONCURRENT_REQUESTS", "3"))  # Reduced for Coqui TTS
+    tts_workers: int = int(os.getenv("TTS_WORKERS", "0"))  # Coqui TTS worker processes (0 = in-process)
     
     # Caching Configuration
     enable_tts_cache: bool = os.getenv("ENABLE_TTS_CACHE", "True").lower() == "true"
     cache_max_size: int = int(os.getenv("CACHE_MAX_SIZE", "1000"))  # Max cached items
+    cache_max_bytes: int = int(os.getenv("CACHE_MAX_BYTES", str(1024 ** 3)))  # 1 GB of cached audio
     cache_ttl: int = int(os.getenv("CACHE_TTL", "86400"))  # 24 hours
     
     # Debug Configuration
@@ -42,6 +46,8 @@ class Settings(BaseSettings):
     gemini_model: str = "gemini-1.5-flash"  # Cost-effective model
     gemini_temperature: float = 0.1
     gemini_max_tokens: int = 8192
+    gemini_rpm: int = int(os.getenv("GEMINI_RPM", "15"))  # Requests per minute (15 on the free tier)
+    gemini_concurrency: int = int(os.getenv("GEMINI_CONCURRENCY", "3"))  # Requests in flight at once
     
     # English-focused TTS Voice Options
     available_voices: dict = {
@@ -61,6 +67,7 @@ class Settings(BaseSettings):
     # Performance Settings
     gpu_enabled: bool = os.getenv("GPU_ENABLED", "True").lower() == "true"
     cpu_threads: int = int(os.getenv("CPU_THREADS", "4"))
+    tts_quantize: bool = os.getenv("TTS_QUANTIZE", "False").lower() == "true"  # int8 Coqui model on CPU
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -76,13 +83,11 @@ class Settings(BaseSettings):
     
     def get_best_tts_engine(self) -> tuple:
         """Get the best available TTS engine and voice."""
-        try:
-            from TTS.api import TTS
-            # Coqui TTS is available
+        # Check for Coqui TTS without importing it (and torch)
+        if importlib.util.find_spec("TTS") is not None:
             return ("coqui-xtts", "tts_models/en/ljspeech/tacotron2-DDC")
-        except ImportError:
-            # Fall back to Edge TTS
-            return ("edge-tts", "en-US-AriaNeural")
+        # Fall back to Edge TTS
+        return ("edge-tts", "en-US-AriaNeural")
     
     class Config:
         env_file = ".env"
@@ -1,8 +1,21 @@
 """Core modules for audiobook conversion."""
 
-from .text_extractor import TextExtractor
-from .text_processor import TextProcessor
-from .tts_converter import TTSConverter
-from .audio_merger import AudioMerger
+import importlib
 
-__all__ = ["TextExtractor", "TextProcessor", "TTSConverter", "AudioMerger"] 
\ No newline at end of file
+# Exported classes are imported on first access, since the TTS and audio
+# modules pull in heavy dependencies (torch, pydub) at import time
+_EXPORTS = {
+    "TextExtractor": ".text_extractor",
+    "TextProcessor": ".text_processor",
+    "TTSConverter": ".tts_converter",
+    "AudioMerger": ".audio_merger",
+    "SegmentCache": ".tts_cache",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        module = importlib.import_module(_EXPORTS[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
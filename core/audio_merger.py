@@ -2,27 +2,63 @@
 
 import asyncio
 import logging
+import math
 import os
+import re
 import tempfile
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import TYPE_CHECKING, Callable, List, Dict, Optional, Tuple
 import subprocess
 
-from pydub import AudioSegment
-from pydub.silence import split_on_silence
-import ffmpeg
-
 from config import settings
 
+if TYPE_CHECKING:
+    from pydub import AudioSegment
+
 logger = logging.getLogger(__name__)
 
+# ffmpeg encoder for each probed codec name, where the two differ
+_FFMPEG_ENCODERS = {'mp3': 'libmp3lame', 'vorbis': 'libvorbis', 'opus': 'libopus'}
+
+# (muxer, extension) to hold a clip of each probed codec; PCM goes in WAV
+_CODEC_CONTAINERS = {
+    'mp3': ('mp3', '.mp3'),
+    'flac': ('flac', '.flac'),
+    'vorbis': ('ogg', '.ogg'),
+    'opus': ('ogg', '.opus'),
+    'aac': ('adts', '.aac'),
+}
+
+# Fields of ffmpeg's volumedetect report
+_VOLUMEDETECT_SAMPLES = re.compile(r'n_samples:\s*(\d+)')
+_VOLUMEDETECT_MEAN = re.compile(r'mean_volume:\s*(-?(?:[\d.]+|inf)) dB')
+
+@lru_cache(maxsize=1)
+def _ffmpeg_available() -> bool:
+    """Probe for ffmpeg once per process; the binary doesn't come and go between merges."""
+    try:
+        subprocess.run(['ffmpeg', '-version'], 
+                     capture_output=True, check=True)
+        return True
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        logger.warning("FFmpeg not available, skipping metadata addition")
+        return False
+
 class AudioMerger:
     """Merge multiple audio files into a single audiobook with metadata."""
     
+    # Loudness the merged audiobook is normalized to
+    TARGET_DBFS = -20.0
+    
+    # Gain small enough to skip, letting MP3 chapters be stream-copied
+    GAIN_TOLERANCE_DB = 0.5
+    
     def __init__(self):
         self.silence_duration = settings.silence_duration * 1000  # Convert to milliseconds
         self.audio_format = settings.audio_format
         self.audio_quality = settings.audio_quality
+        self._silence = None
         
     async def merge_audio_files(self, audio_files: List[str], output_path: str,
                                metadata: Dict[str, str] = None) -> bool:
@@ -70,11 +106,268 @@ class AudioMerger:
             logger.error(f"Audio merging failed: {e}")
             return False
     
-    async def _combine_audio_files(self, audio_files: List[str]) -> Optional[AudioSegment]:
+    async def merge_from_queue(self, queue: asyncio.Queue, output_path: str,
+                               metadata: Dict[str, str] = None,
+                               on_file: Optional[Callable[[str], None]] = None,
+                               manifest_path: Optional[str] = None) -> bool:
+        """
+        Collect audio files from a queue, then concatenate them into an audiobook.
+        
+        Only the per-file work overlaps the producer: each path taken from
+        the queue is probed, measured for loudness and appended to an ffmpeg
+        concat manifest on disk, with a silence clip matching the files'
+        stream between chapters, so no list of paths or audio is held in
+        memory. The concat itself is deferred until ``None`` arrives on the
+        queue, since the gain that brings the whole book to TARGET_DBFS is
+        only known then. It is one ffmpeg pass that re-encodes to MP3 with
+        that gain, or stream-copies MP3 input already within
+        GAIN_TOLERANCE_DB, giving the same gaps and levels as
+        ``merge_audio_files``. Falls back to ``merge_audio_files`` when
+        ffmpeg is unavailable, the files' streams differ, or ffmpeg fails.
+        
+        Args:
+            queue: Queue of audio file paths, terminated by ``None``
+            output_path: Output path for the merged audiobook
+            metadata: Book metadata (title, author, etc.)
+            on_file: Optional callback invoked with each path once it is queued for merging
+            manifest_path: Where to write the concat manifest (default: next to output_path)
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        keep_manifest = manifest_path is not None
+        manifest_path = manifest_path or output_path + ".concat.txt"
+        can_concat = self._is_ffmpeg_available()
+        first_stream = None
+        silence_path = None
+        levels = []
+        file_count = 0
+        
+        try:
+            with open(manifest_path, 'w', encoding='utf-8') as manifest:
+                while True:
+                    audio_file = await queue.get()
+                    if audio_file is None:
+                        break
+                    
+                    if file_count and silence_path:
+                        manifest.write(self._concat_line(silence_path))
+                    file_count += 1
+                    manifest.write(self._concat_line(audio_file))
+                    manifest.flush()
+                    
+                    # The concat demuxer only works if every file matches the first one
+                    if can_concat:
+                        stream = await self._probe_audio_stream(audio_file)
+                        first_stream = first_stream or stream
+                        if stream is None or stream != first_stream:
+                            can_concat = False
+                        elif silence_path is None and self.silence_duration:
+                            silence_path = await self._make_silence_clip(stream, manifest_path + ".silence")
+                            can_concat = silence_path is not None
+                        
+                        level = await self._measure_loudness(audio_file) if can_concat else None
+                        if level is None:
+                            logger.info(f"Cannot concatenate {audio_file} with ffmpeg, merging with pydub instead")
+                            can_concat = False
+                        else:
+                            levels.append(level)
+                    
+                    if on_file:
+                        on_file(audio_file)
+            
+            if not file_count:
+                logger.error("No audio files provided for merging")
+                return False
+            
+            if can_concat:
+                gain = self._normalization_gain(levels, (file_count - 1) * self._silence_samples(first_stream))
+                if first_stream[0] == 'mp3' and abs(gain) <= self.GAIN_TOLERANCE_DB:
+                    # Already at the target level, so MP3 frames can be copied as-is
+                    gain = None
+                if await self._concat_manifest(manifest_path, output_path, metadata,
+                                               encode=first_stream[0] != 'mp3', gain_db=gain):
+                    return True
+            
+            audio_files = self._read_manifest(manifest_path)
+            if silence_path:
+                audio_files = [f for f in audio_files if f != os.path.abspath(silence_path)]
+            return await self.merge_audio_files(audio_files, output_path, metadata)
+            
+        finally:
+            if not keep_manifest:
+                for path in (manifest_path, silence_path):
+                    if path and os.path.exists(path):
+                        os.remove(path)
+    
+    async def _concat_manifest(self, manifest_path: str, output_path: str,
+                               metadata: Dict[str, str] = None, encode: bool = False,
+                               gain_db: Optional[float] = None) -> bool:
+        """
+        Concatenate the files listed in a concat manifest into output_path.
+        
+        Streams are copied as-is, or with ``encode`` decoded PCM is piped
+        straight into one MP3 encode inside ffmpeg, instead of loading every
+        file into pydub. ``gain_db`` applies a volume change and implies
+        ``encode``.
+        """
+        temp_path = output_path + ".temp"
+        encode = encode or gain_db is not None
+        codec_args = ['-c:a', 'libmp3lame', '-b:a', self.audio_quality] if encode else ['-c', 'copy']
+        filter_args = ['-af', f'volume={gain_db:.2f}dB'] if gain_db is not None else []
+        
+        process = await asyncio.create_subprocess_exec(
+            'ffmpeg',
+            '-f', 'concat',
+            '-safe', '0',
+            '-i', manifest_path,
+            *filter_args,
+            *codec_args,
+            '-f', 'mp3',
+            '-y', temp_path,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+        
+        if process.returncode != 0:
+            logger.warning(f"FFmpeg concat failed: {stderr.decode(errors='ignore')[-500:]}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+        
+        logger.info(f"Concatenated audio from {manifest_path} into {output_path}"
+                    f"{' with one MP3 encode' if encode else ' without re-encoding'}")
+        if metadata:
+            return await self._add_metadata_with_ffmpeg(temp_path, output_path, metadata)
+        os.replace(temp_path, output_path)
+        return True
+    
+    async def _probe_audio_stream(self, audio_path: str) -> Optional[Tuple[str, str, str]]:
+        """Return (codec, sample_rate, channels) of the first audio stream, or None."""
+        try:
+            process = await asyncio.create_subprocess_exec(
+                'ffprobe',
+                '-v', 'error',
+                '-select_streams', 'a:0',
+                '-show_entries', 'stream=codec_name,sample_rate,channels',
+                '-of', 'csv=p=0',
+                audio_path,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+            stdout, _ = await process.communicate()
+        except FileNotFoundError:
+            return None
+        
+        fields = stdout.decode().strip().split(',')
+        if process.returncode != 0 or len(fields) != 3:
+            return None
+        return tuple(fields)
+    
+    async def _measure_loudness(self, audio_path: str) -> Optional[Tuple[int, float]]:
+        """Return (sample count, mean power) of a file from ffmpeg's volumedetect, or None."""
+        process = await asyncio.create_subprocess_exec(
+            'ffmpeg',
+            '-hide_banner',
+            '-nostats',
+            '-i', audio_path,
+            '-af', 'volumedetect',
+            '-f', 'null', '-',
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+        
+        report = stderr.decode(errors='ignore')
+        samples = _VOLUMEDETECT_SAMPLES.search(report)
+        mean_volume = _VOLUMEDETECT_MEAN.search(report)
+        if process.returncode != 0 or not samples or not mean_volume:
+            logger.warning(f"Failed to measure loudness of {audio_path}")
+            return None
+        return int(samples.group(1)), 10 ** (float(mean_volume.group(1)) / 10)
+    
+    def _normalization_gain(self, levels: List[Tuple[int, float]], silence_samples: int = 0) -> float:
+        """
+        Gain in dB that brings files measured by _measure_loudness to TARGET_DBFS.
+        
+        Mean power is pooled over every sample, gaps included, so the result
+        matches _normalize_audio on the combined audio.
+        """
+        total_samples = sum(samples for samples, _ in levels) + silence_samples
+        power = sum(samples * mean_power for samples, mean_power in levels)
+        if not total_samples or not power:
+            return 0.0
+        return self.TARGET_DBFS - 10 * math.log10(power / total_samples)
+    
+    def _silence_samples(self, stream: Tuple[str, str, str]) -> int:
+        """Number of samples, across channels, in one gap of the given stream."""
+        _, sample_rate, channels = stream
+        return int(int(sample_rate) * self.silence_duration / 1000) * int(channels)
+    
+    async def _make_silence_clip(self, stream: Tuple[str, str, str], base_path: str) -> Optional[str]:
+        """
+        Write the gap between chapters as a clip in the given stream's format, returning its path.
+        
+        The container follows the probed codec rather than the chapter files'
+        extension, since Coqui writes PCM WAV into files named .mp3.
+        """
+        codec, sample_rate, channels = stream
+        if codec.startswith('pcm_'):
+            container, extension = 'wav', '.wav'
+        elif codec in _CODEC_CONTAINERS:
+            container, extension = _CODEC_CONTAINERS[codec]
+        else:
+            logger.info(f"No container known for {codec} silence clip")
+            return None
+        
+        path = base_path + extension
+        process = await asyncio.create_subprocess_exec(
+            'ffmpeg',
+            '-f', 'lavfi',
+            '-i', f'anullsrc=r={sample_rate}',
+            '-t', f'{self.silence_duration / 1000:.3f}',
+            '-ac', channels,
+            '-c:a', _FFMPEG_ENCODERS.get(codec, codec),
+            *(['-b:a', self.audio_quality] if codec == 'mp3' else []),
+            '-f', container,
+            '-y', path,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+        
+        if process.returncode != 0:
+            logger.warning(f"Failed to create silence clip: {stderr.decode(errors='ignore')[-500:]}")
+            if os.path.exists(path):
+                os.remove(path)
+            return None
+        return path
+    
+    @staticmethod
+    def _concat_line(audio_path: str) -> str:
+        """Format a path as an ffmpeg concat demuxer entry."""
+        escaped = os.path.abspath(audio_path).replace("'", "'\\''")
+        return f"file '{escaped}'\n"
+    
+    @staticmethod
+    def _read_manifest(manifest_path: str) -> List[str]:
+        """Read the file paths back out of an ffmpeg concat manifest."""
+        audio_files = []
+        with open(manifest_path, 'r', encoding='utf-8') as manifest:
+            for line in manifest:
+                line = line.rstrip('\n')
+                if line.startswith("file '") and line.endswith("'"):
+                    audio_files.append(line[6:-1].replace("'\\''", "'"))
+        return audio_files
+    
+    async def _combine_audio_files(self, audio_files: List[str]) -> Optional['AudioSegment']:
         """Combine multiple audio files with silence between them."""
+        from pydub import AudioSegment
+        
         try:
-            combined = None
-            silence = AudioSegment.silent(duration=self.silence_duration)
+            parts = []
+            silence = self._get_silence()
             
             for i, audio_file in enumerate(audio_files):
                 if not os.path.exists(audio_file):
@@ -91,25 +384,46 @@ class AudioMerger:
                     continue
                 
                 # Add to combined audio
-                if combined is None:
-                    combined = audio
-                else:
-                    combined = combined + silence + audio
+                if parts:
+                    parts.append(silence)
+                parts.append(audio)
             
-            return combined
+            if not parts:
+                return None
+            
+            # Join the raw PCM once; chaining + recopies the whole book per chapter.
+            # Match formats first the way pydub's + would
+            channels = max(part.channels for part in parts)
+            frame_rate = max(part.frame_rate for part in parts)
+            sample_width = max(part.sample_width for part in parts)
+            parts = [
+                part.set_channels(channels).set_frame_rate(frame_rate).set_sample_width(sample_width)
+                for part in parts
+            ]
+            
+            return AudioSegment(
+                data=b"".join(part.raw_data for part in parts),
+                sample_width=sample_width,
+                frame_rate=frame_rate,
+                channels=channels
+            )
             
         except Exception as e:
             logger.error(f"Failed to combine audio files: {e}")
             return None
     
-    def _normalize_audio(self, audio: AudioSegment) -> AudioSegment:
+    def _get_silence(self) -> 'AudioSegment':
+        """Return the gap inserted between chapters, built once per merger."""
+        if self._silence is None:
+            from pydub import AudioSegment
+            self._silence = AudioSegment.silent(duration=self.silence_duration)
+        return self._silence
+    
+    def _normalize_audio(self, audio: 'AudioSegment') -> 'AudioSegment':
         """Normalize audio levels for consistent playback."""
         try:
-            # Target loudness in dBFS
-            target_dbfs = -20.0
-            
             # Calculate the change needed
-            change_in_dbfs = target_dbfs - audio.dBFS
+            change_in_dbfs = self.TARGET_DBFS - audio.dBFS
             
             # Apply normalization
             normalized_audio = audio.apply_gain(change_in_dbfs)
@@ -122,7 +436,7 @@ class AudioMerger:
             logger.warning(f"Audio normalization failed: {e}")
             return audio
     
-    async def _export_with_metadata(self, audio: AudioSegment, output_path: str,
+    async def _export_with_metadata(self, audio: 'AudioSegment', output_path: str,
                                    metadata: Dict[str, str] = None) -> bool:
         """Export audio with metadata using ffmpeg."""
         try:
@@ -151,13 +465,7 @@ class AudioMerger:
     
     def _is_ffmpeg_available(self) -> bool:
         """Check if ffmpeg is available on the system."""
-        try:
-            subprocess.run(['ffmpeg', '-version'], 
-                         capture_output=True, check=True)
-            return True
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            logger.warning("FFmpeg not available, skipping metadata addition")
-            return False
+        return _ffmpeg_available()
     
     async def _add_metadata_with_ffmpeg(self, input_path: str, output_path: str,
                                        metadata: Dict[str, str]) -> bool:
@@ -189,16 +497,21 @@ class AudioMerger:
             # Add output file
             cmd.append(output_path)
             
-            # Run ffmpeg
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            # Run ffmpeg without blocking the event loop
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            _, stderr = await process.communicate()
             
-            if result.returncode == 0:
+            if process.returncode == 0:
                 # Remove temporary file
-                os.remove(input_path)
+                await asyncio.get_running_loop().run_in_executor(None, os.remove, input_path)
                 logger.info("Metadata added successfully")
                 return True
             else:
-                logger.error(f"FFmpeg failed: {result.stderr}")
+                logger.error(f"FFmpeg failed: {stderr.decode(errors='ignore')}")
                 # Fallback: move temp file to output
                 os.rename(input_path, output_path)
                 return True
@@ -214,8 +527,11 @@ class AudioMerger:
     
     def split_audio_by_silence(self, audio_path: str, 
                               min_silence_len: int = 1000,
-                              silence_thresh: int = -40) -> List[AudioSegment]:
+                              silence_thresh: int = -40) -> List['AudioSegment']:
         """Split audio file by silence (useful for chapter detection)."""
+        from pydub import AudioSegment
+        from pydub.silence import split_on_silence
+        
         try:
             audio = AudioSegment.from_file(audio_path)
             chunks = split_on_silence(
@@ -234,6 +550,8 @@ class AudioMerger:
     
     def get_audio_info(self, audio_path: str) -> Dict[str, any]:
         """Get information about an audio file."""
+        from pydub import AudioSegment
+        
         try:
             audio = AudioSegment.from_file(audio_path)
             
@@ -257,6 +575,8 @@ class AudioMerger:
     async def create_chapter_markers(self, audio_files: List[str],
                                    chapter_titles: List[str] = None) -> List[Dict[str, any]]:
         """Create chapter markers for the audiobook."""
+        from pydub import AudioSegment
+        
         markers = []
         current_time = 0
         
@@ -294,6 +614,8 @@ class AudioMerger:
     
     def validate_audio_file(self, audio_path: str) -> bool:
         """Validate if an audio file is readable."""
+        from pydub import AudioSegment
+        
         try:
             audio = AudioSegment.from_file(audio_path)
             return len(audio) > 0
@@ -1,16 +1,23 @@
 """Text extraction module for EPUB and PDF files."""
 
 import os
+import re
 import asyncio
+import atexit
+import importlib.util
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
-import aiofiles
 
 # PDF processing
 import PyPDF2
 import pdfplumber
 
+# PDFium (C++) is much faster than pdfminer-based pdfplumber; imported only where used
+PDFIUM_AVAILABLE = importlib.util.find_spec("pypdfium2") is not None
+
 # EPUB processing
 import ebooklib
 from ebooklib import epub
@@ -20,11 +27,101 @@ from config import settings
 
 logger = logging.getLogger(__name__)
 
+# Compiled once; _clean_text runs for every page and chapter
+_WHITESPACE = re.compile(r'\s+')
+
+# Common formatting issues, fixed in a single pass over the text
+_TEXT_FIXES = {
+    '\ufeff': '',     # BOM character
+    'â€™': "'",       # Smart quote
+    'â€œ': '"',       # Smart quote
+    'â€\x9d': '"',    # Smart quote
+    'â€"': '—',       # Em dash
+}
+_TEXT_FIXES_RE = re.compile('|'.join(map(re.escape, _TEXT_FIXES)))
+
+# Signatures checked before handing a file to a parser; PDF readers accept
+# the header anywhere in the first 1 KB, EPUBs are ZIP archives
+_PDF_MAGIC = b'%PDF-'
+_EPUB_MAGIC = b'PK\x03\x04'
+
+# Pages handed to each PDF worker process per task
+PDF_PAGES_PER_TASK = 16
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """
+    Return the shared PDF extraction process pool, creating it on first use.
+    
+    Workers are spawned, not forked, since the app server is multi-threaded
+    and may already have torch loaded; the pool is shut down at exit.
+    """
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(
+            max_workers=max(1, settings.cpu_threads),
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        atexit.register(_pdf_pool.shutdown, cancel_futures=True)
+    return _pdf_pool
+
+def _count_pdf_pages(file_path: str) -> int:
+    """Return the number of pages in a PDF."""
+    if PDFIUM_AVAILABLE:
+        import pypdfium2 as pdfium
+        
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    
+    with pdfplumber.open(file_path) as pdf:
+        return len(pdf.pages)
+
+def _extract_pdf_pages(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """
+    Extract raw text from pages [start, end) of a PDF. Runs in a worker process.
+    
+    Uses PDFium when pypdfium2 is installed, falling back to pdfplumber if it
+    is missing or fails on the range.
+    """
+    if PDFIUM_AVAILABLE:
+        try:
+            return _extract_pdf_pages_pdfium(file_path, start, end)
+        except Exception as e:
+            logger.warning(f"PDFium failed on pages {start + 1}-{end}, trying pdfplumber: {e}")
+    
+    with pdfplumber.open(file_path) as pdf:
+        return [(page_num, pdf.pages[page_num].extract_text() or '') for page_num in range(start, end)]
+
+def _extract_pdf_pages_pdfium(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Extract raw text from pages [start, end) of a PDF with PDFium."""
+    import pypdfium2 as pdfium
+    
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        pages = []
+        for page_num in range(start, end):
+            page = pdf[page_num]
+            textpage = page.get_textpage()
+            try:
+                pages.append((page_num, textpage.get_text_bounded()))
+            finally:
+                textpage.close()
+                page.close()
+        return pages
+    finally:
+        pdf.close()
+
 class TextExtractor:
     """Extract text from various ebook formats."""
     
-    def __init__(self):
-        self.supported_formats = ['.epub', '.pdf', '.txt']
+    supported_formats = frozenset({'.epub', '.pdf', '.txt'})
+    
+    # Bump when extraction output changes so cached results are invalidated
+    EXTRACTOR_VERSION = 2
     
     async def extract_text(self, file_path: str) -> Dict[str, any]:
         """
@@ -50,6 +147,9 @@ class TextExtractor:
         if file_extension not in self.supported_formats:
             raise ValueError(f"Unsupported file format: {file_extension}")
         
+        if not self._has_expected_signature(file_path, file_extension):
+            raise ValueError(f"File content does not match its {file_extension} extension")
+        
         logger.info(f"Extracting text from {file_path}")
         
         try:
@@ -63,8 +163,26 @@ class TextExtractor:
             logger.error(f"Error extracting text from {file_path}: {e}")
             raise
     
+    def _has_expected_signature(self, file_path: Path, file_extension: str) -> bool:
+        """Sniff the leading bytes so mislabelled files fail fast instead of in a parser."""
+        if file_extension == '.txt':
+            return True
+        
+        with open(file_path, 'rb') as f:
+            head = f.read(1024)
+        
+        if file_extension == '.pdf':
+            return _PDF_MAGIC in head
+        return head.startswith(_EPUB_MAGIC)
+    
     async def _extract_epub(self, file_path: Path) -> Dict[str, any]:
         """Extract text from EPUB file."""
+        # ebooklib and BeautifulSoup are blocking, so parse in the thread pool
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._extract_epub_sync, file_path)
+    
+    def _extract_epub_sync(self, file_path: Path) -> Dict[str, any]:
+        """Read and parse an EPUB file. Blocking; call via _extract_epub."""
         book = epub.read_epub(str(file_path))
         
         # Extract metadata
@@ -76,31 +194,30 @@ class TextExtractor:
         }
         
         chapters = []
-        full_text = ""
-        
-        # Extract text from each chapter
-        for item in book.get_items():
-            if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                # Parse HTML content
-                soup = BeautifulSoup(item.get_content(), 'html.parser')
-                
-                # Remove script and style elements
-                for script in soup(["script", "style"]):
-                    script.decompose()
-                
-                # Extract text
-                chapter_text = soup.get_text()
-                
-                # Clean up text
-                chapter_text = self._clean_text(chapter_text)
-                
-                if chapter_text.strip():  # Only add non-empty chapters
-                    chapters.append({
-                        'title': item.get_name(),
-                        'text': chapter_text
-                    })
-                    full_text += chapter_text + "\n\n"
         
+        # Extract text from each chapter, skipping images, CSS and fonts
+        for item in book.get_items_of_type(ebooklib.ITEM_DOCUMENT):
+            # Parse only the body with lxml's C parser (already a dependency)
+            soup = BeautifulSoup(item.get_body_content(), 'lxml')
+            
+            # Remove script and style elements
+            for script in soup(["script", "style"]):
+                script.decompose()
+            
+            # Extract text
+            chapter_text = soup.get_text()
+            
+            # Clean up text
+            chapter_text = self._clean_text(chapter_text)
+            
+            if chapter_text.strip():  # Only add non-empty chapters
+                chapters.append({
+                    'title': item.get_name(),
+                    'text': chapter_text
+                })
+        
+        # Join once instead of growing a string per chapter
+        full_text = "\n\n".join(chapter['text'] for chapter in chapters)
         word_count = len(full_text.split())
         
         return {
@@ -114,37 +231,34 @@ class TextExtractor:
     async def _extract_pdf(self, file_path: Path) -> Dict[str, any]:
         """Extract text from PDF file."""
         chapters = []
-        full_text = ""
+        loop = asyncio.get_running_loop()
         
-        # Try pdfplumber first (better text extraction)
+        # Try PDFium/pdfplumber first (better text extraction)
         try:
-            import pdfplumber
-            with pdfplumber.open(file_path) as pdf:
-                for page_num, page in enumerate(pdf.pages):
-                    page_text = page.extract_text()
+            page_count = await loop.run_in_executor(None, _count_pdf_pages, str(file_path))
+            
+            # Page extraction is CPU-bound, so spread page ranges across
+            # worker processes and reassemble them in order
+            pool = _get_pdf_pool()
+            page_ranges = await asyncio.gather(*[
+                loop.run_in_executor(pool, _extract_pdf_pages, str(file_path), start,
+                                     min(start + PDF_PAGES_PER_TASK, page_count))
+                for start in range(0, page_count, PDF_PAGES_PER_TASK)
+            ])
+            
+            for pages in page_ranges:
+                for page_num, page_text in pages:
                     if page_text:
                         page_text = self._clean_text(page_text)
                         chapters.append({
                             'title': f'Page {page_num + 1}',
                             'text': page_text
                         })
-                        full_text += page_text + "\n\n"
         except Exception as e:
             logger.warning(f"pdfplumber failed, trying PyPDF2: {e}")
             
             # Fallback to PyPDF2
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                for page_num, page in enumerate(pdf_reader.pages):
-                    page_text = page.extract_text()
-                    if page_text:
-                        page_text = self._clean_text(page_text)
-                        chapters.append({
-                            'title': f'Page {page_num + 1}',
-                            'text': page_text
-                        })
-                        full_text += page_text + "\n\n"
+            chapters = await loop.run_in_executor(None, self._extract_pdf_pages_pypdf2, file_path)
         
         # Basic metadata (PDFs don't always have rich metadata)
         metadata = {
@@ -154,6 +268,7 @@ class TextExtractor:
             'publisher': 'Unknown',
         }
         
+        full_text = "\n\n".join(chapter['text'] for chapter in chapters)
         word_count = len(full_text.split())
         
         return {
@@ -164,10 +279,30 @@ class TextExtractor:
             'format': 'pdf'
         }
     
+    def _extract_pdf_pages_pypdf2(self, file_path: Path) -> List[Dict[str, str]]:
+        """Extract one chapter per non-empty page with PyPDF2. Blocking."""
+        chapters = []
+        
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            
+            for page_num, page in enumerate(pdf_reader.pages):
+                page_text = page.extract_text()
+                if page_text:
+                    page_text = self._clean_text(page_text)
+                    chapters.append({
+                        'title': f'Page {page_num + 1}',
+                        'text': page_text
+                    })
+        
+        return chapters
+    
     async def _extract_txt(self, file_path: Path) -> Dict[str, any]:
         """Extract text from TXT file."""
-        async with aiofiles.open(file_path, 'r', encoding='utf-8') as file:
-            full_text = await file.read()
+        # One bounded blocking read in the thread pool is cheaper than aiofiles'
+        # per-call executor round-trips
+        loop = asyncio.get_running_loop()
+        full_text = await loop.run_in_executor(None, file_path.read_text, 'utf-8')
         
         # For text files, we'll create artificial chapters based on length
         full_text = self._clean_text(full_text)
@@ -195,23 +330,15 @@ class TextExtractor:
         if not text:
             return ""
         
-        # Normalize whitespace
-        import re
-        text = re.sub(r'\s+', ' ', text)
-        text = re.sub(r'\n\s*\n', '\n\n', text)
+        # Normalize whitespace (\s also covers non-breaking spaces and newlines,
+        # so no separate blank-line pass is needed)
+        text = _WHITESPACE.sub(' ', text)
         
         # Remove excessive whitespace at beginning and end
         text = text.strip()
         
         # Handle common formatting issues
-        text = text.replace('\u00a0', ' ')  # Non-breaking space
-        text = text.replace('\ufeff', '')   # BOM character
-        text = text.replace('â€™', "'")     # Smart quote
-        text = text.replace('â€œ', '"')     # Smart quote
-        text = text.replace('â€\x9d', '"')  # Smart quote
-        text = text.replace('â€"', '—')     # Em dash
-        
-        return text
+        return _TEXT_FIXES_RE.sub(lambda m: _TEXT_FIXES[m.group()], text)
     
     def _split_into_chapters(self, text: str, max_words_per_chapter: int = 3000) -> List[Dict[str, str]]:
         """Split long text into manageable chapters."""
@@ -233,8 +360,8 @@ class TextExtractor:
         """Validate if file can be processed."""
         try:
             file_path = Path(file_path)
-            return (file_path.exists() and 
-                   file_path.suffix.lower() in self.supported_formats and
+            # stat() raises for missing files, so one syscall covers both checks
+            return (file_path.suffix.lower() in self.supported_formats and
                    file_path.stat().st_size > 0)
         except Exception:
             return False 
\ No newline at end of file
@@ -1,9 +1,12 @@
 """Text processing module using Gemini AI for TTS optimization."""
 
 import asyncio
+import hashlib
 import logging
+import os
 import re
-from typing import List, Dict, Optional
+from pathlib import Path
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 import google.generativeai as genai
 from asyncio_throttle import Throttler
 
@@ -11,16 +14,27 @@ from config import settings
 
 logger = logging.getLogger(__name__)
 
+# Sentence boundary: whitespace following terminal punctuation
+_SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+')
+
 class TextProcessor:
     """Process and optimize text for TTS using Gemini AI."""
     
+    # Bump when the system prompt changes so cached results are invalidated
+    PROMPT_VERSION = 2
+    
     def __init__(self):
-        # Configure Gemini
+        # Configure Gemini; this also drops the SDK's cached clients, so the
+        # model's async client is created on the caller's event loop
         genai.configure(api_key=settings.gemini_api_key)
         self.model = genai.GenerativeModel(settings.gemini_model)
         
-        # Rate limiting for cost optimization
-        self.throttler = Throttler(rate_limit=15, period=60)  # 15 requests per minute for free tier
+        # Rate limiting for cost optimization; raise GEMINI_RPM on paid tiers
+        self.throttler = Throttler(rate_limit=settings.gemini_rpm, period=60)
+        
+        # Exact-match cache of Gemini responses, shared across books
+        self.cache_dir = Path(settings.temp_dir) / 'gemini_cache'
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
         
         # System prompt for TTS optimization
         self.system_prompt = """You are a text optimization expert for audiobook creation. Your task is to process text to make it perfect for text-to-speech conversion.
@@ -45,7 +59,7 @@ DO NOT:
 - Add content that wasn't in the original
 
 Return ONLY the optimized text, nothing else."""
-
+    
     async def process_text(self, text: str, chunk_size: Optional[int] = None) -> str:
         """
         Process text using Gemini AI for TTS optimization.
@@ -68,39 +82,76 @@ Return ONLY the optimized text, nothing else."""
         logger.info(f"Processing {len(chunks)} text chunks with Gemini")
         
         # Process chunks concurrently with rate limiting
-        processed_chunks = await self._process_chunks_async(chunks)
+        processed_chunks = await self._process_chunks_async(chunks, self._overlap_contexts(chunks))
         
         # Combine processed chunks
         final_text = self._combine_chunks(processed_chunks)
         
         return final_text
     
-    async def process_chapters(self, chapters: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    async def process_chapters(self, chapters: List[Dict[str, str]],
+                               chunk_size: Optional[int] = None) -> List[Dict[str, str]]:
         """
         Process multiple chapters with optimization.
         
         Args:
             chapters: List of chapter dictionaries with 'title' and 'text'
+            chunk_size: Size of chunks to process (default from settings)
             
         Returns:
             List of processed chapters
         """
         processed_chapters = []
-        
-        for i, chapter in enumerate(chapters):
-            logger.info(f"Processing chapter {i+1}/{len(chapters)}: {chapter.get('title', 'Untitled')}")
-            
-            processed_text = await self.process_text(chapter['text'])
-            
-            processed_chapters.append({
-                'title': chapter['title'],
-                'text': processed_text,
-                'original_length': len(chapter['text']),
-                'processed_length': len(processed_text)
-            })
+        async for _, chapter in self.iter_processed_chapters(chapters, chunk_size):
+            processed_chapters.append(chapter)
         
         return processed_chapters
     
+    async def iter_processed_chapters(self, chapters: List[Dict[str, str]],
+                                      chunk_size: Optional[int] = None) -> AsyncIterator[Tuple[int, Dict[str, str]]]:
+        """
+        Process chapters, yielding (index, chapter) in order as each one finishes.
+        
+        Every chunk of the book is submitted up front, and a chapter is
+        yielded as soon as its own chunks are done, so a consumer such as
+        TTS can start on early chapters while later ones are still with
+        Gemini. A chapter's 'ai_fallback' is True when any of its chunks
+        fell back to basic cleanup.
+        """
+        chunk_size = chunk_size or settings.max_chunk_size
+        
+        # Submit the whole book as one workload instead of chapter by chapter,
+        # so requests stay in flight across chapter boundaries
+        chapter_chunks = [
+            self._split_text_into_chunks(chapter['text'], chunk_size)
+            if chapter['text'] and chapter['text'].strip() else []
+            for chapter in chapters
+        ]
+        all_chunks = [chunk for chunks in chapter_chunks for chunk in chunks]
+        # Context never crosses a chapter boundary
+        all_contexts = [context for chunks in chapter_chunks for context in self._overlap_contexts(chunks)]
+        
+        logger.info(f"Processing {len(all_chunks)} text chunks from {len(chapters)} chapters with Gemini")
+        tasks = self._start_chunk_tasks(all_chunks, all_contexts)
+        offset = 0
+        
+        try:
+            for i, (chapter, chunks) in enumerate(zip(chapters, chapter_chunks)):
+                results = await asyncio.gather(*tasks[offset:offset + len(chunks)], return_exceptions=True)
+                processed_text = self._combine_chunks(self._resolve_chunk_results(results, chunks))
+                offset += len(chunks)
+                
+                yield i, {
+                    'title': chapter['title'],
+                    'text': processed_text,
+                    'original_length': len(chapter['text']),
+                    'processed_length': len(processed_text),
+                    'ai_fallback': any(isinstance(result, Exception) for result in results)
+                }
+        finally:
+            for task in tasks:
+                task.cancel()
+    
     def _split_text_into_chunks(self, text: str, chunk_size: int) -> List[str]:
         """Split text into chunks while preserving sentence boundaries."""
         if len(text) <= chunk_size:
@@ -109,40 +160,84 @@ Return ONLY the optimized text, nothing else."""
         chunks = []
         sentences = self._split_into_sentences(text)
         
-        current_chunk = ""
+        # Collect sentences and track the joined length instead of growing a string
+        current_chunk = []
+        current_size = 0
         for sentence in sentences:
             # If adding this sentence would exceed chunk size, start a new chunk
-            if current_chunk and len(current_chunk) + len(sentence) > chunk_size:
-                chunks.append(current_chunk.strip())
-                current_chunk = sentence
+            if current_chunk and current_size + len(sentence) > chunk_size:
+                chunks.append(" ".join(current_chunk))
+                current_chunk = [sentence]
+                current_size = len(sentence)
             else:
-                current_chunk += " " + sentence if current_chunk else sentence
+                current_size += len(sentence) + 1 if current_chunk else len(sentence)
+                current_chunk.append(sentence)
         
         # Add the last chunk if it exists
         if current_chunk:
-            chunks.append(current_chunk.strip())
+            chunks.append(" ".join(current_chunk))
         
         return chunks
     
     def _split_into_sentences(self, text: str) -> List[str]:
         """Split text into sentences using regex."""
         # Simple sentence splitting - can be improved
-        sentences = re.split(r'(?<=[.!?])\s+', text)
+        sentences = _SENTENCE_BREAK.split(text)
         return [s.strip() for s in sentences if s.strip()]
     
-    async def _process_chunks_async(self, chunks: List[str]) -> List[str]:
-        """Process chunks asynchronously with rate limiting."""
-        semaphore = asyncio.Semaphore(settings.max_concurrent_requests)
+    def _overlap_contexts(self, chunks: List[str]) -> List[str]:
+        """
+        Build the read-only context sent with each chunk.
         
-        async def process_single_chunk(chunk: str) -> str:
+        Each chunk after the first gets the tail of the chunk before it,
+        CHUNK_OVERLAP_RATIO of its length, so Gemini sees dialogue and
+        sentences that straddle the boundary. Chunks stay non-overlapping;
+        the context is never echoed back into the output.
+        """
+        contexts = [''] * len(chunks)
+        ratio = settings.chunk_overlap_ratio
+        if ratio <= 0:
+            return contexts
+        
+        for i in range(1, len(chunks)):
+            previous = chunks[i - 1]
+            tail = previous[len(previous) - int(len(previous) * ratio):]
+            # Start on a word boundary
+            contexts[i] = tail.partition(' ')[2] or tail
+        
+        return contexts
+    
+    async def _process_chunks_async(self, chunks: List[str],
+                                    contexts: Optional[List[str]] = None) -> List[str]:
+        """Process chunks asynchronously with rate limiting."""
+        tasks = self._start_chunk_tasks(chunks, contexts)
+        processed_chunks = await asyncio.gather(*tasks, return_exceptions=True)
+        return self._resolve_chunk_results(processed_chunks, chunks)
+    
+    def _start_chunk_tasks(self, chunks: List[str],
+                           contexts: Optional[List[str]] = None) -> List[asyncio.Task]:
+        """Schedule every chunk for Gemini processing, bounded by concurrency and rate limits."""
+        semaphore = asyncio.Semaphore(settings.gemini_concurrency)
+        contexts = contexts or [''] * len(chunks)
+        
+        async def process_single_chunk(chunk: str, context: str) -> str:
+            # Cache hits don't count against the rate limit
+            cached = self._load_cached_response(chunk, context)
+            if cached is not None:
+                return cached
+            
             async with semaphore:
                 async with self.throttler:
-                    return await self._process_single_chunk(chunk)
+                    return await self._process_single_chunk(chunk, context)
         
         # Process all chunks concurrently
-        tasks = [process_single_chunk(chunk) for chunk in chunks]
-        processed_chunks = await asyncio.gather(*tasks, return_exceptions=True)
-        
+        return [
+            asyncio.create_task(process_single_chunk(chunk, context))
+            for chunk, context in zip(chunks, contexts)
+        ]
+    
+    def _resolve_chunk_results(self, processed_chunks: List, chunks: List[str]) -> List[str]:
+        """Replace failed chunk results with a basic cleanup of the original text."""
         # Handle any exceptions
         result_chunks = []
         for i, result in enumerate(processed_chunks):
@@ -155,31 +250,62 @@ Return ONLY the optimized text, nothing else."""
         
         return result_chunks
     
-    async def _process_single_chunk(self, chunk: str) -> str:
-        """Process a single chunk with Gemini."""
-        try:
-            # Create the full prompt
-            prompt = f"{self.system_prompt}\n\nText to optimize:\n{chunk}"
-            
-            # Generate response
-            response = await self.model.generate_content_async(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=settings.gemini_temperature,
-                    max_output_tokens=settings.gemini_max_tokens,
-                )
+    async def _process_single_chunk(self, chunk: str, context: str = '') -> str:
+        """
+        Process a single chunk with Gemini, optionally seeing the text before it.
+        
+        Raises on API errors and empty responses, so callers can tell a
+        fallback cleanup from a Gemini result (see _resolve_chunk_results).
+        """
+        # Create the full prompt
+        prompt = self.system_prompt
+        if context:
+            prompt += f"\n\nPreceding text (context only, do not include it in your output):\n{context}"
+        prompt += f"\n\nText to optimize:\n{chunk}"
+        
+        # Generate response
+        response = await self.model.generate_content_async(
+            prompt,
+            generation_config=genai.types.GenerationConfig(
+                temperature=settings.gemini_temperature,
+                max_output_tokens=settings.gemini_max_tokens,
             )
-            
-            if response.text:
-                return response.text.strip()
-            else:
-                logger.warning("Empty response from Gemini, using basic cleanup")
-                return self._basic_text_cleanup(chunk)
-                
-        except Exception as e:
-            logger.error(f"Error calling Gemini API: {e}")
-            # Fallback to basic text cleanup
-            return self._basic_text_cleanup(chunk)
+        )
+        
+        if not response.text:
+            raise ValueError("Empty response from Gemini")
+        
+        result = response.text.strip()
+        self._store_cached_response(chunk, context, result)
+        return result
+    
+    def _response_cache_path(self, chunk: str, context: str = '') -> Path:
+        """Cache file for a chunk, keyed by prompt version, model settings, context and text."""
+        key = hashlib.blake2b(digest_size=16)
+        key.update(f"{self.PROMPT_VERSION}\0{settings.gemini_model}\0{settings.gemini_temperature}\0".encode('utf-8'))
+        key.update(context.strip().encode('utf-8') + b'\0')
+        key.update(chunk.strip().encode('utf-8'))
+        return self.cache_dir / f"{key.hexdigest()}.txt"
+    
+    def _load_cached_response(self, chunk: str, context: str = '') -> Optional[str]:
+        """Return the cached Gemini response for a chunk, or None on a miss."""
+        try:
+            return self._response_cache_path(chunk, context).read_text(encoding='utf-8')
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Failed to read cached Gemini response: {e}")
+            return None
+    
+    def _store_cached_response(self, chunk: str, context: str, response: str):
+        """Atomically cache a Gemini response for a chunk."""
+        cache_path = self._response_cache_path(chunk, context)
+        temp_path = cache_path.with_suffix('.tmp')
+        try:
+            temp_path.write_text(response, encoding='utf-8')
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Failed to cache Gemini response: {e}")
     
     def _basic_text_cleanup(self, text: str) -> str:
         """Basic text cleanup as fallback when Gemini is unavailable."""
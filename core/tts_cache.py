@@ -0,0 +1,174 @@
+"""Disk-persistent segment cache for synthesized TTS audio."""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+class SegmentCache:
+    """Size-bounded on-disk cache of audio segments with LFU-with-aging eviction."""
+    
+    INDEX_FILE = 'cache_index.json'
+    
+    # One instance per cache directory, see shared()
+    _instances: Dict[Path, 'SegmentCache'] = {}
+    _instances_lock = threading.Lock()
+    
+    def __init__(self, root: Union[str, Path], max_bytes: int):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.index_path = self.root / self.INDEX_FILE
+        
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+        self._dirty = False
+    
+    @classmethod
+    def shared(cls, root: Union[str, Path], max_bytes: int) -> 'SegmentCache':
+        """
+        Return the process-wide cache for root, creating it on first use.
+        
+        The index is held in memory and rewritten whole on every save, so
+        two instances on one directory would drop each other's entries.
+        Everything in a process that uses a directory should go through here.
+        """
+        root = Path(root).resolve()
+        with cls._instances_lock:
+            cache = cls._instances.get(root)
+            if cache is None:
+                cache = cls._instances[root] = cls(root, max_bytes)
+            return cache
+    
+    @staticmethod
+    def make_key(text: str, engine: str, voice: str, speech_rate: float = 1.0) -> str:
+        """Build a cache key from the text and synthesis settings."""
+        # Keyed BLAKE2 namespaces the text hash per engine/voice/rate; the
+        # namespace is digested first since BLAKE2 keys are capped at 64 bytes
+        namespace = f"{engine}\0{voice}\0{speech_rate}".encode('utf-8')
+        hash_key = hashlib.blake2b(namespace, digest_size=32).digest()
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16, key=hash_key).hexdigest()
+    
+    def get(self, key: str) -> Optional[Path]:
+        """Return the cached file for key, or None on a miss."""
+        with self._lock:
+            entry = self._index.get(key)
+            if not entry:
+                return None
+            
+            path = self.root / entry['file']
+            if not path.exists():
+                del self._index[key]
+                self._dirty = True
+                return None
+            
+            # Hit stats are written with the next put or flush, not per lookup
+            entry['last_used'] = time.time()
+            entry['hits'] += 1
+            self._dirty = True
+            return path
+    
+    def put(self, key: str, src_path: Union[str, Path]) -> Optional[Path]:
+        """Copy src_path into the cache under key, evicting entries if over budget."""
+        src_path = Path(src_path)
+        dest = self.root / f"{key}{src_path.suffix}"
+        
+        with self._lock:
+            try:
+                shutil.copyfile(src_path, dest)
+            except OSError as e:
+                logger.warning(f"Failed to cache segment {src_path}: {e}")
+                return None
+            
+            self._index[key] = {
+                'file': dest.name,
+                'size': dest.stat().st_size,
+                'last_used': time.time(),
+                'hits': 0
+            }
+            self._evict(protect=key)
+            self._save_index()
+            return dest
+    
+    def flush(self):
+        """Write pending hit statistics to the index."""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+    
+    def clear(self):
+        """Remove every cached segment."""
+        with self._lock:
+            for entry in self._index.values():
+                self._remove_file(entry['file'])
+            self._index = {}
+            self._save_index()
+    
+    @property
+    def total_bytes(self) -> int:
+        """Total size of all cached segments in bytes."""
+        return sum(entry['size'] for entry in self._index.values())
+    
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+    
+    def __len__(self) -> int:
+        return len(self._index)
+    
+    def _evict(self, protect: Optional[str] = None):
+        """Evict the least valuable entries until the cache fits in max_bytes."""
+        total = self.total_bytes
+        now = time.time()
+        
+        # Score by hit rate over age, so old popular entries eventually age out
+        candidates = sorted(
+            (key for key in self._index if key != protect),
+            key=lambda k: (self._index[k]['hits'] + 1) / (now - self._index[k]['last_used'] + 1)
+        )
+        
+        for key in candidates:
+            if total <= self.max_bytes:
+                break
+            
+            entry = self._index.pop(key)
+            self._remove_file(entry['file'])
+            total -= entry['size']
+            logger.debug(f"Evicted cached segment: {key}")
+    
+    def _remove_file(self, filename: str):
+        """Delete a cached file, ignoring files that are already gone."""
+        try:
+            os.remove(self.root / filename)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove cached segment {filename}: {e}")
+    
+    def _load_index(self) -> Dict[str, Dict]:
+        """Load the cache index from disk."""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load cache index, starting empty: {e}")
+            return {}
+    
+    def _save_index(self):
+        """Atomically write the cache index to disk."""
+        temp_path = self.index_path.with_suffix('.tmp')
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._index, f)
+            os.replace(temp_path, self.index_path)
+            self._dirty = False
+        except OSError as e:
+            logger.warning(f"Failed to save cache index: {e}")
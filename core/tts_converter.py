@@ -1,34 +1,107 @@
 """Text-to-Speech conversion module with multiple engine support and caching."""
 
 import asyncio
+import atexit
+import importlib.util
 import logging
+import multiprocessing
 import os
+import re
 import tempfile
-import hashlib
 import json
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Optional, Union
-import aiofiles
-import diskcache as dc
-import soundfile as sf
+from typing import AsyncIterator, List, Dict, Optional, Tuple, Union
 
 # TTS engines
 import edge_tts
 from gtts import gTTS
 import pyttsx3
 
-# Coqui TTS
-try:
-    from TTS.api import TTS
-    COQUI_AVAILABLE = True
-except ImportError:
-    COQUI_AVAILABLE = False
+# Coqui TTS (imported on first use, it pulls in torch)
+COQUI_AVAILABLE = importlib.util.find_spec("TTS") is not None
+if not COQUI_AVAILABLE:
     logging.warning("Coqui TTS not available. Install with: pip install TTS")
 
 from config import settings
+from .tts_cache import SegmentCache
 
 logger = logging.getLogger(__name__)
 
+# Filename sanitization patterns, compiled once
+_UNSAFE_FILENAME_CHARS = re.compile(r'[<>:"/\\|?*]')
+_WHITESPACE = re.compile(r'\s+')
+
+# Abbreviations spelled out before synthesis, expanded in one regex pass
+_TTS_ABBREVIATIONS = {
+    'Dr.': 'Doctor ',
+    'Mr.': 'Mister ',
+    'Mrs.': 'Misses ',
+    'Ms.': 'Miss ',
+    'Prof.': 'Professor ',
+    'etc.': 'etcetera',
+    'i.e.': 'that is',
+    'e.g.': 'for example',
+}
+_TTS_ABBREVIATION_RE = re.compile(r'\b(?:' + '|'.join(map(re.escape, _TTS_ABBREVIATIONS)) + ')')
+
+# Coqui model loaded once in each TTS worker process
+_worker_coqui_tts = None
+
+# Coqui worker pools shared by every TTSConverter, keyed by (model_name, use_gpu)
+_coqui_pools: Dict[Tuple[str, bool], ProcessPoolExecutor] = {}
+
+def _quantize_coqui_model(coqui_tts):
+    """Swap the Coqui acoustic model's Linear/LSTM layers for dynamic int8 versions. CPU only."""
+    import torch
+    
+    synthesizer = coqui_tts.synthesizer
+    synthesizer.tts_model = torch.quantization.quantize_dynamic(
+        synthesizer.tts_model, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8
+    )
+
+def _init_coqui_worker(model_name: str, use_gpu: bool):
+    """Load the Coqui model into a TTS worker process."""
+    global _worker_coqui_tts
+    from TTS.api import TTS
+    
+    _worker_coqui_tts = TTS(model_name=model_name, progress_bar=False)
+    if use_gpu:
+        import torch
+        
+        _worker_coqui_tts = _worker_coqui_tts.to("cuda")
+        torch.backends.cudnn.benchmark = True
+    elif settings.tts_quantize:
+        _quantize_coqui_model(_worker_coqui_tts)
+
+def _get_coqui_pool(model_name: str, use_gpu: bool) -> ProcessPoolExecutor:
+    """
+    Return the process-wide Coqui worker pool for a model, starting it on first use.
+    
+    Coqui ignores the voice, so converters cached per (engine, voice) share
+    one pool instead of each holding TTS_WORKERS model copies. The pool is
+    shut down at exit.
+    """
+    key = (model_name, use_gpu)
+    if key not in _coqui_pools:
+        pool = ProcessPoolExecutor(
+            max_workers=settings.tts_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_coqui_worker,
+            initargs=key
+        )
+        atexit.register(pool.shutdown, cancel_futures=True)
+        _coqui_pools[key] = pool
+    return _coqui_pools[key]
+
+def _coqui_worker_tts_to_file(text: str, output_path: str):
+    """Synthesize text with the worker's Coqui model. Runs in a worker process."""
+    import torch
+    
+    with torch.inference_mode():
+        _worker_coqui_tts.tts_to_file(text=text, file_path=output_path)
+
 class TTSConverter:
     """Convert text to speech using various TTS engines with caching."""
     
@@ -38,15 +111,20 @@ class TTSConverter:
         self.supported_engines = ['coqui-xtts', 'edge-tts', 'gtts', 'pyttsx3']
         
         # Initialize cache
-        self.cache = dc.Cache(os.path.join(settings.temp_dir, 'tts_cache'))
+        self.cache = SegmentCache.shared(os.path.join(settings.temp_dir, 'tts_cache'), settings.cache_max_bytes)
         self.cache_enabled = True
         
+        # Concurrent requests for network-bound engines (edge-tts, gtts)
+        self.concurrency = settings.max_concurrent_requests
+        
         if self.engine not in self.supported_engines:
             logger.warning(f"Engine {self.engine} not supported. Falling back to edge-tts")
             self.engine = 'edge-tts'
         
         # Initialize engines
         self.coqui_tts = None
+        self.coqui_model_name = None
+        self.coqui_gpu = False
         self.pyttsx3_engine = None
         
         self._init_engines()
@@ -61,26 +139,43 @@ class TTSConverter:
     def _init_coqui_tts(self):
         """Initialize Coqui TTS with English-optimized models."""
         try:
+            import torch
+            
             # Use the best English model for high quality
             model_name = "tts_models/en/ljspeech/tacotron2-DDC"  # High quality English
             # Alternative: "tts_models/en/vctk/vits" for multi-speaker
+            self.coqui_model_name = model_name
+            
+            # Enable GPU if available and not disabled via GPU_ENABLED
+            self.coqui_gpu = settings.gpu_enabled and torch.cuda.is_available()
+            
+            # Worker processes load their own copies; don't hold one more here
+            if settings.tts_workers > 0:
+                logger.info(f"Coqui TTS model {model_name} will load in {settings.tts_workers} worker processes")
+                return
+            
+            from TTS.api import TTS
             
             logger.info(f"Loading Coqui TTS model: {model_name}")
             self.coqui_tts = TTS(model_name=model_name, progress_bar=False)
             
-            # Enable GPU if available
-            import torch
-            if torch.cuda.is_available():
+            if self.coqui_gpu:
                 self.coqui_tts = self.coqui_tts.to("cuda")
+                # Let cuDNN pick the fastest kernels for the model's layer shapes
+                torch.backends.cudnn.benchmark = True
                 logger.info("Coqui TTS using GPU acceleration")
             else:
                 logger.info("Coqui TTS using CPU")
+                if settings.tts_quantize:
+                    _quantize_coqui_model(self.coqui_tts)
+                    logger.info("Coqui TTS model quantized to int8")
                 
         except Exception as e:
             logger.error(f"Failed to initialize Coqui TTS: {e}")
             logger.info("Falling back to Edge TTS")
             self.engine = 'edge-tts'
             self.coqui_tts = None
+            self.coqui_model_name = None
     
     def _init_pyttsx3(self):
         """Initialize pyttsx3 engine."""
@@ -101,16 +196,17 @@ class TTSConverter:
     
     def _get_cache_key(self, text: str, engine: str, voice: str) -> str:
         """Generate cache key for text and settings."""
-        content = f"{text}_{engine}_{voice}_{settings.speech_rate}"
-        return hashlib.md5(content.encode()).hexdigest()
+        return SegmentCache.make_key(text, engine, voice, settings.speech_rate)
     
-    async def convert_text_to_audio(self, text: str, output_path: str) -> bool:
+    async def convert_text_to_audio(self, text: str, output_path: str,
+                                    cache_enabled: Optional[bool] = None) -> bool:
         """
         Convert text to audio file with caching.
         
         Args:
             text: Text to convert
             output_path: Path to save the audio file
+            cache_enabled: Use the segment cache for this call (default: self.cache_enabled)
             
         Returns:
             True if successful, False otherwise
@@ -119,18 +215,12 @@ class TTSConverter:
             logger.warning("Empty text provided for TTS conversion")
             return False
         
-        # Check cache first
-        cache_key = self._get_cache_key(text, self.engine, self.voice)
+        if cache_enabled is None:
+            cache_enabled = self.cache_enabled
         
-        if self.cache_enabled and cache_key in self.cache:
-            logger.info(f"Using cached audio for text: {text[:50]}...")
-            try:
-                cached_audio = self.cache[cache_key]
-                async with aiofiles.open(output_path, 'wb') as f:
-                    await f.write(cached_audio)
-                return True
-            except Exception as e:
-                logger.warning(f"Failed to use cached audio: {e}")
+        # Check cache first
+        if cache_enabled and await self._load_from_cache(text, output_path):
+            return True
         
         try:
             # Convert based on engine
@@ -145,14 +235,8 @@ class TTSConverter:
                 success = await self._convert_with_pyttsx3(text, output_path)
             
             # Cache the result if successful
-            if success and self.cache_enabled:
-                try:
-                    async with aiofiles.open(output_path, 'rb') as f:
-                        audio_data = await f.read()
-                        self.cache[cache_key] = audio_data
-                        logger.debug(f"Cached audio for key: {cache_key}")
-                except Exception as e:
-                    logger.warning(f"Failed to cache audio: {e}")
+            if success and cache_enabled:
+                await self._store_in_cache(text, output_path)
             
             return success
             
@@ -160,73 +244,188 @@ class TTSConverter:
             logger.error(f"TTS conversion failed: {e}")
             return False
     
+    async def _load_from_cache(self, text: str, output_path: str) -> bool:
+        """Write cached audio for text to output_path, returning True on a cache hit."""
+        cache_key = self._get_cache_key(text, self.engine, self.voice)
+        cached_path = self.cache.get(cache_key)
+        if cached_path:
+            logger.info(f"Using cached audio for text: {text[:50]}...")
+            try:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, shutil.copyfile, cached_path, output_path)
+                return True
+            except Exception as e:
+                logger.warning(f"Failed to use cached audio: {e}")
+        
+        return False
+    
+    async def _store_in_cache(self, text: str, output_path: str):
+        """Store the audio at output_path in the cache for text."""
+        cache_key = self._get_cache_key(text, self.engine, self.voice)
+        try:
+            loop = asyncio.get_running_loop()
+            if await loop.run_in_executor(None, self.cache.put, cache_key, output_path):
+                logger.debug(f"Cached audio for key: {cache_key}")
+        except Exception as e:
+            logger.warning(f"Failed to cache audio: {e}")
+    
     async def convert_chapters_to_audio(self, chapters: List[Dict[str, str]], 
-                                      output_dir: str) -> List[str]:
+                                      output_dir: str, cache_enabled: Optional[bool] = None,
+                                      concurrency: Optional[int] = None) -> List[str]:
         """
         Convert multiple chapters to audio files with optimized concurrency.
         """
-        os.makedirs(output_dir, exist_ok=True)
         audio_files = []
+        async for _, audio_file in self.iter_chapter_audio(chapters, output_dir, cache_enabled, concurrency):
+            audio_files.append(audio_file)
+        
+        return sorted(audio_files)
+    
+    async def iter_chapter_audio(self, chapters: List[Dict[str, str]], output_dir: str,
+                                 cache_enabled: Optional[bool] = None,
+                                 concurrency: Optional[int] = None) -> AsyncIterator[Tuple[int, str]]:
+        """
+        Convert chapters concurrently, yielding (index, path) in chapter order.
+        
+        Each chapter is yielded as soon as it and every chapter before it have
+        finished, so a consumer can start merging while later chapters are
+        still being synthesized. Failed chapters are logged and skipped.
+        Network engines run up to concurrency (default: self.concurrency)
+        requests at once. Passing cache_enabled and concurrency per call,
+        rather than setting attributes, keeps a converter shared between
+        sessions safe to use concurrently.
+        """
+        async def chapter_source():
+            for item in enumerate(chapters):
+                yield item
+        
+        async for item in self.iter_chapter_audio_stream(chapter_source(), output_dir,
+                                                         cache_enabled, concurrency):
+            yield item
+    
+    async def iter_chapter_audio_stream(self, chapters: AsyncIterator[Tuple[int, Dict[str, str]]],
+                                        output_dir: str, cache_enabled: Optional[bool] = None,
+                                        concurrency: Optional[int] = None) -> AsyncIterator[Tuple[int, str]]:
+        """
+        Convert chapters as they arrive from an async source, yielding (index, path) in order.
+        
+        Like iter_chapter_audio, but each chapter starts converting as soon as
+        the source produces it (e.g. AI processing), so synthesis overlaps
+        the stage before it. Failed chapters are logged and skipped.
+        """
+        os.makedirs(output_dir, exist_ok=True)
         
         # Adjust concurrency based on engine
-        max_concurrent = 2 if self.engine == 'coqui-xtts' else settings.max_concurrent_requests
+        max_concurrent = max(2, settings.tts_workers) if self.engine == 'coqui-xtts' else concurrency or self.concurrency
         semaphore = asyncio.Semaphore(max_concurrent)
+        scheduled = asyncio.Queue()
+        tasks = []
         
-        async def convert_single_chapter(chapter: Dict[str, str], index: int) -> Optional[str]:
-            async with semaphore:
-                chapter_title = chapter.get('title', f'Chapter {index + 1}')
-                safe_title = self._sanitize_filename(chapter_title)
-                output_path = os.path.join(output_dir, f"{index:03d}_{safe_title}.mp3")
-                
-                logger.info(f"Converting chapter: {chapter_title}")
-                
-                # Process text for TTS with English optimizations
-                processed_text = self._prepare_text_for_tts(chapter['text'])
-                
-                success = await self.convert_text_to_audio(processed_text, output_path)
-                
-                if success:
-                    return output_path
-                else:
-                    logger.error(f"Failed to convert chapter: {chapter_title}")
-                    return None
-        
-        # Convert all chapters
-        tasks = [convert_single_chapter(chapter, i) for i, chapter in enumerate(chapters)]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        async def schedule():
+            try:
+                async for i, chapter in chapters:
+                    task = asyncio.create_task(self._convert_chapter(chapter, i, output_dir, semaphore, cache_enabled))
+                    tasks.append(task)
+                    await scheduled.put((i, task))
+            finally:
+                await scheduled.put(None)
         
-        # Filter successful conversions
-        for result in results:
-            if isinstance(result, str) and result:
-                audio_files.append(result)
-            elif isinstance(result, Exception):
-                logger.error(f"Chapter conversion error: {result}")
+        scheduler = asyncio.create_task(schedule())
         
-        return sorted(audio_files)
+        try:
+            while True:
+                item = await scheduled.get()
+                if item is None:
+                    break
+                
+                i, task = item
+                try:
+                    result = await task
+                except Exception as e:
+                    logger.error(f"Chapter conversion error: {e}")
+                    continue
+                
+                if result:
+                    yield i, result
+            
+            # Surface errors from the chapter source
+            await scheduler
+        finally:
+            scheduler.cancel()
+            for task in tasks:
+                task.cancel()
+            self.cache.flush()
+    
+    async def _convert_chapter(self, chapter: Dict[str, str], index: int, output_dir: str,
+                               semaphore: asyncio.Semaphore,
+                               cache_enabled: Optional[bool] = None) -> Optional[str]:
+        """Convert a single chapter to audio, returning its path on success."""
+        async with semaphore:
+            chapter_title = chapter.get('title', f'Chapter {index + 1}')
+            output_path = self._chapter_output_path(chapter, index, output_dir)
+            
+            logger.info(f"Converting chapter: {chapter_title}")
+            
+            # Process text for TTS with English optimizations
+            processed_text = self._prepare_text_for_tts(chapter['text'])
+            
+            success = await self.convert_text_to_audio(processed_text, output_path, cache_enabled)
+            
+            if success:
+                return output_path
+            else:
+                logger.error(f"Failed to convert chapter: {chapter_title}")
+                return None
+    
+    def _chapter_output_path(self, chapter: Dict[str, str], index: int, output_dir: str) -> str:
+        """Build the audio file path for a chapter."""
+        chapter_title = chapter.get('title', f'Chapter {index + 1}')
+        safe_title = self._sanitize_filename(chapter_title)
+        return os.path.join(output_dir, f"{index:03d}_{safe_title}.mp3")
     
     async def _convert_with_coqui_tts(self, text: str, output_path: str) -> bool:
         """Convert text using Coqui TTS - Highest Quality."""
         try:
-            if not self.coqui_tts:
+            pool = self._get_coqui_pool()
+            if not pool and not self.coqui_tts:
                 raise Exception("Coqui TTS not initialized")
             
             # Coqui TTS runs synchronously, so run in thread pool
             import asyncio
-            loop = asyncio.get_event_loop()
-            
-            def sync_convert():
-                self.coqui_tts.tts_to_file(
-                    text=text,
-                    file_path=output_path
-                )
+            loop = asyncio.get_running_loop()
             
-            await loop.run_in_executor(None, sync_convert)
+            if pool:
+                await loop.run_in_executor(pool, _coqui_worker_tts_to_file, text, output_path)
+            else:
+                await loop.run_in_executor(None, self._coqui_tts_to_file, text, output_path)
             return os.path.exists(output_path)
             
         except Exception as e:
             logger.error(f"Coqui TTS conversion failed: {e}")
             return False
     
+    def _get_coqui_pool(self) -> Optional[ProcessPoolExecutor]:
+        """
+        Return the Coqui worker pool, starting it on first use.
+        
+        Coqui holds the GIL through its Python glue, so threads don't run
+        syntheses in parallel. With TTS_WORKERS > 0 each worker process loads
+        the model once at startup and keeps it warm, and the parent process
+        never loads its own copy. Workers are spawned, not forked, so CUDA
+        can initialize in each of them.
+        """
+        if settings.tts_workers <= 0 or not self.coqui_model_name:
+            return None
+        
+        return _get_coqui_pool(self.coqui_model_name, self.coqui_gpu)
+    
+    def _coqui_tts_to_file(self, text: str, output_path: str):
+        """Synthesize with Coqui TTS without autograd bookkeeping. Blocking."""
+        import torch
+        
+        with torch.inference_mode():
+            self.coqui_tts.tts_to_file(text=text, file_path=output_path)
+    
     async def _convert_with_edge_tts(self, text: str, output_path: str) -> bool:
         """Convert text using Edge TTS."""
         try:
@@ -250,7 +449,10 @@ class TTSConverter:
         try:
             # Use English with better accent
             tts = gTTS(text=text, lang='en', tld='com', slow=False)
-            tts.save(output_path)
+            
+            # gTTS blocks on HTTP, so run it in the thread pool to allow concurrency
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, tts.save, output_path)
             return True
         except Exception as e:
             logger.error(f"Google TTS conversion failed: {e}")
@@ -264,7 +466,7 @@ class TTSConverter:
             
             # Run in thread pool to avoid blocking
             import asyncio
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
             
             def sync_convert():
                 self.pyttsx3_engine.save_to_file(text, output_path)
@@ -282,31 +484,15 @@ class TTSConverter:
         if not text:
             return ""
         
-        # English-specific text preprocessing
-        import re
-        
         # Handle common abbreviations
-        text = re.sub(r'\bDr\.', 'Doctor ', text)
-        text = re.sub(r'\bMr\.', 'Mister ', text)
-        text = re.sub(r'\bMrs\.', 'Misses ', text)
-        text = re.sub(r'\bMs\.', 'Miss ', text)
-        text = re.sub(r'\bProf\.', 'Professor ', text)
-        text = re.sub(r'\betc\.', 'etcetera', text)
-        text = re.sub(r'\bi\.e\.', 'that is', text)
-        text = re.sub(r'\be\.g\.', 'for example', text)
-        
-        # Handle numbers better
-        text = re.sub(r'\b(\d+)st\b', r'\1st', text)  # 1st, 21st
-        text = re.sub(r'\b(\d+)nd\b', r'\1nd', text)  # 2nd, 22nd
-        text = re.sub(r'\b(\d+)rd\b', r'\1rd', text)  # 3rd, 23rd
-        text = re.sub(r'\b(\d+)th\b', r'\1th', text)  # 4th, 5th, etc.
+        text = _TTS_ABBREVIATION_RE.sub(lambda m: _TTS_ABBREVIATIONS[m.group()], text)
         
         # Handle pause markers
         text = text.replace('[pause]', '... ')
         text = text.replace('###', '... ')
         
         # Normalize whitespace
-        text = re.sub(r'\s+', ' ', text)
+        text = _WHITESPACE.sub(' ', text)
         text = text.strip()
         
         # Ensure proper sentence ending
@@ -317,9 +503,8 @@ class TTSConverter:
     
     def _sanitize_filename(self, filename: str) -> str:
         """Sanitize filename for safe file system usage."""
-        import re
-        filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
-        filename = re.sub(r'\s+', '_', filename)
+        filename = _UNSAFE_FILENAME_CHARS.sub('_', filename)
+        filename = _WHITESPACE.sub('_', filename)
         filename = filename.strip('._')
         
         if len(filename) > 100:
@@ -340,7 +525,8 @@ class TTSConverter:
         try:
             return {
                 "cache_size": len(self.cache),
-                "cache_directory": self.cache.directory,
+                "cache_bytes": self.cache.total_bytes,
+                "cache_directory": str(self.cache.root),
                 "cache_enabled": self.cache_enabled
             }
         except:
@@ -374,7 +560,10 @@ class TTSConverter:
     
     def estimate_audio_duration(self, text: str, words_per_minute: int = 150) -> float:
         """Estimate audio duration in seconds."""
-        word_count = len(text.split())
+        return self.estimate_audio_duration_from_word_count(len(text.split()), words_per_minute)
+    
+    def estimate_audio_duration_from_word_count(self, word_count: int, words_per_minute: int = 150) -> float:
+        """Estimate audio duration in seconds from a precomputed word count."""
         return (word_count / words_per_minute) * 60
     
     def get_engine_info(self) -> Dict[str, any]:
@@ -386,11 +575,7 @@ class TTSConverter:
             "cache_info": self.get_cache_info()
         }
         
-        if self.engine == 'coqui-xtts' and self.coqui_tts:
-            try:
-                import torch
-                info["device"] = "cuda" if torch.cuda.is_available() else "cpu"
-            except:
-                info["device"] = "cpu"
+        if self.engine == 'coqui-xtts' and self.coqui_model_name:
+            info["device"] = "cuda" if self.coqui_gpu else "cpu"
         
         return info 
\ No newline at end of file
@@ -74,7 +74,6 @@ def install_dependencies():
     
     # Install caching dependencies
     caching_commands = [
-        "pip install diskcache>=5.6.3",
         "pip install redis>=5.0.1", 
         "pip install joblib>=1.3.2"
     ]